@@ -6,16 +6,26 @@
 
 import abc
 import networkx as nx
-from typing import Any, Union, List
+import numpy as np
+from pyncd.utils.tools import group_labels
+from typing import Any, Union, List, Dict
 
 
 class BaseDetector(object, metaclass=abc.ABCMeta):
     """Abstract class for all community detection algorithms.
     """
+    # The attributes set by `fit`, checked by `check_is_fitted`.
+    __fitted_attrs__ = ("_nodes", "_labels")
 
     @abc.abstractmethod
     def __init__(self) -> None:
-        pass
+        # The fitted partition is stored as the community index of every node. The
+        # other post-fit artefacts are built from it lazily, on first access.
+        self._nodes = None
+        self._labels = None
+        self._node2com = None
+        self._node2idx = None
+        self._com_graph = None
 
     @abc.abstractmethod
     def fit(self, graph: nx.Graph, weight: Union[str, None] = "weight") -> object:
@@ -50,6 +60,83 @@ class BaseDetector(object, metaclass=abc.ABCMeta):
         """
         pass
 
+    @property
+    def decision_com_num_(self) -> Union[int, None]:
+        """The number of best communities
+        """
+        if self._labels is None:
+            return None
+        return int(self._labels.max()) + 1 if len(self._labels) > 0 else 0
+
+    @property
+    def decision_com_node2com_(self) -> Union[Dict[Any, int], None]:
+        """Mapping of nodes and best communities index.
+        """
+        if self._node2com is None and self._labels is not None:
+            self._node2com = dict(zip(self._nodes, self._labels.tolist()))
+        return self._node2com
+
+    @property
+    def decision_com_graph_(self) -> Union[nx.Graph, None]:
+        """The graph of best communities.
+        Each node represents one community and contains all the nodes that constitute it.
+        """
+        if self._com_graph is None and self._labels is not None:
+            self._com_graph = self._gen_com_graph()
+        return self._com_graph
+
+    def _set_partition(self, nodes: List[Any], labels: np.ndarray, com_graph: nx.Graph = None) -> None:
+        """Stores the fitted partition and drops the artefacts built from a previous fit.
+
+        Parameters
+        ----------
+        nodes : The nodes of the fitted graph.
+        labels : An array of the communities index of `nodes`, numbered from 0.
+        com_graph : NetworkX Graph, optional (default=None)
+            The graph of best communities, if it is already available.
+        """
+        self._nodes = nodes
+        self._labels = labels
+        self._node2com = None
+        self._node2idx = None
+        self._com_graph = com_graph
+
+    def _labels_of(self, nodes: List[Any]) -> np.ndarray:
+        """Gathers the communities index of the given nodes from the fitted label array.
+
+        Parameters
+        ----------
+        nodes : The input nodes.
+
+        Returns
+        -------
+        An int32 array of the communities index of `nodes`.
+        """
+        if self._node2idx is None:
+            self._node2idx = {node: i for i, node in enumerate(self._nodes)}
+        ids = np.fromiter(map(self._node2idx.__getitem__, nodes), dtype=np.int64)
+        return self._labels[ids]
+
+    def _gen_com_graph(self, com_graph: nx.Graph = None) -> nx.Graph:
+        """Generate the graph of best communities from the fitted partition
+
+        Parameters
+        ----------
+        com_graph : NetworkX Graph, optional (default=None)
+            The empty graph to fill. If None, a new NetworkX Graph is used.
+
+        Returns
+        -------
+        NetworkX Graph
+            Each node represents one community and contains all the nodes that constitute it.
+        """
+        com_graph = nx.Graph() if com_graph is None else com_graph
+        com_graph.add_nodes_from(
+            (com, {"nodes": {self._nodes[i] for i in members.tolist()}})
+            for com, members in enumerate(group_labels(self._labels))
+        )
+        return com_graph
+
     # def draw(self):
     #     pass
 
@@ -6,14 +6,13 @@ Reference implementation: https://github.com/networkx/networkx/blob/main/network
 # License: BSD 2 clause
 
 import networkx as nx
-import random
-from collections import Counter, defaultdict
-from networkx.convert import from_dict_of_lists
-from networkx.utils import groups
+import numpy as np
+from collections import Counter
+from numba import njit, prange
 from pyncd.models.base import BaseDetector
-from pyncd.utils.converter import convert_multigraph
-from pyncd.utils.tools import color_network, check_is_fitted
-from typing import Any, Union, List, Dict, Set
+from pyncd.utils.converter import convert_multigraph, to_csr
+from pyncd.utils.tools import color_csr, check_is_fitted, max_degree, set_numba_seed
+from typing import Any, Union, List, Dict, Tuple
 
 
 class LPADetector(BaseDetector):
@@ -28,16 +27,19 @@ class LPADetector(BaseDetector):
 
     Parameters
     ----------
-    async_type : str, default="async", ["async", "semi"]
+    async_type : str, default="async", ["async", "semi", "sync"]
         If "async", each node is updated without waiting for updates on the remaining nodes.
         If "semi", using a semi-synchronous label propagation method. This method combines the
-        advantages of both the synchronous and asynchronous models. Not implemented for directed graphs.
+        advantages of both the synchronous and asynchronous models. For directed graphs, nodes are
+        colored with their predecessors and successors as neighbors.
+        If "sync", all nodes are updated simultaneously from the labels of the previous sweep,
+        in parallel over the available threads.
     alpha : float, default=1.0
         The parameter of the node's out edge, which takes effect in a directed graph.
     beta : float, default=1.0
         The parameter of the node's in edge, which takes effect in a directed graph.
     random_state： int, default=123
-        the seed used by the random
+        the seed used by the random, set at the start of every fit
 
     Attributes
     ----------
@@ -56,11 +58,6 @@ class LPADetector(BaseDetector):
         self.alpha = alpha
         self.beta = beta
         self.random_state = random_state
-        random.seed(random_state)
-
-        self.decision_com_graph_ = None
-        self.decision_com_num_ = None
-        self.decision_com_node2com_ = None
 
     def fit(self, graph: nx.Graph, weight: Union[str, None] = "weight") -> object:
         """Fit detector. Find the best partition of a graph using the Label Propagation Community Detection Algorithm.
@@ -84,24 +81,25 @@ class LPADetector(BaseDetector):
         the ordering happens using a random shuffle.
         """
         is_directed = graph.is_directed()
+        # Plain graphs are read in place by the array builders, only the parallel edges of
+        # a multigraph have to be merged into a new graph first.
         if graph.is_multigraph():
-            new_graph = convert_multigraph(graph, weight, is_directed)
-        else:
-            new_graph = graph.__class__()
-            new_graph.add_nodes_from(graph)
-            new_graph.add_weighted_edges_from(
-                graph.edges(data=weight, default=1))
+            graph = convert_multigraph(graph, weight, 1, is_directed)
+            weight = "weight"
 
         if self.async_type == "async":
-            labels = self.async_lpa(new_graph, weight)
+            labels = self.async_lpa(graph, weight)
         elif self.async_type == "semi":
-            labels = self.semi_async_lpa(new_graph, weight)
+            labels = self.semi_async_lpa(graph, weight)
+        elif self.async_type == "sync":
+            labels = self.sync_lpa(graph, weight)
         else:
             raise NotImplementedError(f"`{self.async_type}` is not implemented")
 
-        self.decision_com_num_ = len(set(labels.values()))
-        self.decision_com_node2com_ = labels
-        self.decision_com_graph_ = from_dict_of_lists(groups(labels))
+        # Relabel the communities to 0..k-1
+        _, inverse = np.unique(np.fromiter(labels.values(), dtype=np.int64, count=len(labels)),
+                               return_inverse=True)
+        self._set_partition(list(labels), inverse.astype(np.int32))
 
         return self
 
@@ -122,11 +120,12 @@ class LPADetector(BaseDetector):
         >>> G = nx.tutte_graph()
         >>> detector = LPADetector()
         >>> detector.fit(G)
+        LPADetector
         >>> detector.decision_function([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
-        [1, 1, 10, 1, 1, 29, 27, 8, 8, 10]
+        [0, 0, 0, 0, 0, 6, 1, 11, 11, 2]
         """
-        check_is_fitted(self, ["decision_com_graph_", "decision_com_num_", "decision_com_node2com_"])
-        return [self.decision_com_node2com_[node] for node in nodes]
+        check_is_fitted(self)
+        return self._labels_of(nodes).tolist()
 
     def async_lpa(self, graph: nx.Graph, weight: Union[str, None] = "weight") -> Dict[Any, int]:
         """Returns communities in `G` as detected by asynchronous label propagation.
@@ -154,33 +153,25 @@ class LPADetector(BaseDetector):
         -------
         labels : A dict keyed by node to labels
         """
-        labels = {n: i for i, n in enumerate(graph)}
-        neighbours = self._get_neighbours_weight(graph, weight)
+        indptr, indices, weights, nodes = self._get_neighbours_weight(graph, weight)
+        labels = np.arange(len(nodes), dtype=np.int32)
+        order = np.arange(len(nodes), dtype=np.int32)
+        set_numba_seed(self.random_state)
         cont = True
 
         while cont:
-            cont = False
-            nodes = list(graph)
+            cont = _async_lpa_csr(indptr, indices, weights, labels, order)
 
-            for node in nodes:
-                best_labels = self.most_frequent_labels(node, labels, neighbours)
+        return dict(zip(nodes, labels.tolist()))
 
-                # If the node does not have one of the maximum frequency labels,
-                # randomly choose one of them and update the node's label.
-                # Continue the iteration as long as at least one node
-                # doesn't have a maximum frequency label.
-                if labels[node] not in best_labels:
-                    labels[node] = random.choice(list(best_labels))
-                    cont = True
+    def sync_lpa(self, graph: nx.Graph, weight: Union[str, None] = "weight") -> Dict[Any, int]:
+        """Returns communities in `G` as detected by synchronous label propagation.
 
-        return labels
-
-    def semi_async_lpa(self, graph: nx.Graph, weight: Union[str, None] = "weight"):
-        """Generates community sets determined by label propagation
-
-        Finds communities in `graph` using a semi-synchronous label propagation
-        method. This method combines the advantages of both the synchronous
-        and asynchronous models.
+        Every node takes the label that appears most frequently among its neighbors
+        in the previous sweep, so the nodes of a sweep are updated in parallel. Ties
+        are broken with the Prec-Max rule. Synchronous updates may oscillate, e.g. on
+        bipartite structures, hence the sweeps stop once the labels converge or repeat
+        those of two sweeps before, and the labeling is completed asynchronously.
 
         Parameters
         ----------
@@ -197,100 +188,67 @@ class LPADetector(BaseDetector):
         -------
         labels : A dict keyed by node to labels
         """
-        coloring = color_network(graph)
-        neighbours = self._get_neighbours_weight(graph, weight)
-
-        # Create a unique label for each node in the graph
-        labels = {v: k for k, v in enumerate(graph)}
-        while not self._labeling_complete(labels, neighbours):
-            # Update the labels of every node with the same color.
-            for color, nodes in coloring.items():
-                for n in nodes:
-                    self._update_label(n, labels, neighbours)
-
-        return labels
+        indptr, indices, weights, nodes = self._get_neighbours_weight(graph, weight)
+        labels = np.arange(len(nodes), dtype=np.int32)
+        new_labels = np.empty_like(labels)
+        last_labels = np.full_like(labels, -1)
+
+        while _sync_lpa_csr(indptr, indices, weights, labels, new_labels):
+            if np.array_equal(new_labels, last_labels):
+                break
+            last_labels, labels, new_labels = labels, new_labels, last_labels
+
+        order = np.arange(len(nodes), dtype=np.int32)
+        set_numba_seed(self.random_state)
+        cont = True
 
-    def _labeling_complete(self,
-                           labels: Dict[Any, int],
-                           neighbours: Dict[Any, Dict[Any, float]]) -> bool:
-        """Determines whether or not LPA is done.
+        while cont:
+            cont = _async_lpa_csr(indptr, indices, weights, labels, order)
 
-        Label propagation is complete when all nodes have a label that is
-        in the set of highest frequency labels amongst its neighbors.
-        Nodes with no neighbors are considered complete.
+        return dict(zip(nodes, labels.tolist()))
 
-        Parameters
-        ----------
-        labels : a dict keyed by node to labels
-        neighbours : The edge weight dict of the neighbor node.
+    def semi_async_lpa(self, graph: nx.Graph, weight: Union[str, None] = "weight"):
+        """Generates community sets determined by label propagation
 
-        Returns
-        -------
-        Whether the LPA is done
-        """
-        return all(
-            labels[v] in self.most_frequent_labels(
-                v, labels, neighbours) for v in neighbours.keys() if len(neighbours[v]) > 0
-        )
-
-    @staticmethod
-    def most_frequent_labels(
-            node: Any,
-            labels: Dict[Any, int],
-            neighbours: Dict[Any, Dict[Any, float]]) -> Set[int]:
-        """Returns a set of all labels with maximum frequency in `labels`.
-        Input `labels` should be a dict keyed by node to labels.
+        Finds communities in `graph` using a semi-synchronous label propagation
+        method. This method combines the advantages of both the synchronous
+        and asynchronous models.
 
         Parameters
         ----------
-        node : node in 'graph'
-        labels : A dict keyed by node to labels.
-        neighbours : The edge weight dict of the neighbor node.
+        graph : NetworkX Graph or DiGraph
+            The graph from which to detect communities
+        weight : string or None, optional (default="weight")
+            The edge attribute representing the weight of an edge.
+            If None, each edge is assumed to have weight one. In this
+            algorithm, the weight of an edge is used in determining the
+            frequency with which a label appears among the neighbors of a
+            node: a higher weight means the label appears more often.
 
         Returns
         -------
-        A set of all labels with maximum frequency in `labels`.
+        labels : A dict keyed by node to labels
         """
-        if not neighbours[node]:
-            # Nodes with no neighbors are themselves a community and are labeled
-            # accordingly, hence the immediate if statement.
-            return {labels[node]}
-
-        # Compute the frequencies of all neighbours of node
-        label_freq = defaultdict(float)
-        for n, wt in neighbours[node].items():
-            label_freq[labels[n]] += wt
+        indptr, indices, weights, nodes = self._get_neighbours_weight(graph, weight)
 
-        max_freq = max(label_freq.values())
-        return {label for label, freq in label_freq.items() if freq == max_freq}
+        # Visit the nodes color by color. Nodes of the same color are not adjacent,
+        # so updating them one after another equals updating them simultaneously.
+        order = np.argsort(color_csr(indptr, indices), kind="stable").astype(np.int32)
 
-    def _update_label(self,
-                      node: Any,
-                      labels: Dict[Any, int],
-                      neighbours: Dict[Any, Dict[Any, float]]) -> None:
-        """Updates the label of a node using the Prec-Max tie breaking algorithm
+        # Create a unique label for each node in the graph. Labeling is complete
+        # once a whole sweep leaves every label unchanged.
+        labels = np.arange(len(nodes), dtype=np.int32)
+        changed = True
+        while changed:
+            changed = _semi_lpa_csr(indptr, indices, weights, labels, order)
 
-        The algorithm is explained in: 'Community Detection via Semi-Synchronous
-        Label Propagation Algorithms' Cordasco and Gargano, 2011
+        return dict(zip(nodes, labels.tolist()))
 
-        Parameters
-        ----------
-        node : node in 'graph'
-        labels : A dict keyed by node to labels
-        neighbours : The edge weight dict of the neighbor node.
-        """
-        high_labels = self.most_frequent_labels(node, labels, neighbours)
-        if len(high_labels) == 1:
-            labels[node] = high_labels.pop()
-        elif len(high_labels) > 1:
-            # Prec-Max
-            if labels[node] not in high_labels:
-                labels[node] = max(high_labels)
-
-    def _get_neighbours_weight(self,
-                               graph: nx.Graph,
-                               weight: Union[str, None] = "weight") -> Dict[Any, Dict[Any, float]]:
-        """Gets the weight dict for the edges in the graph.
+    def _get_neighbours_weight(
+            self,
+            graph: nx.Graph,
+            weight: Union[str, None] = "weight") -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Any]]:
+        """Gets the CSR adjacency holding the weights of the edges in the graph.
 
         Parameters
         ----------
@@ -304,19 +262,229 @@ class LPADetector(BaseDetector):
 
         Returns
         -------
-        neighbours : The edge weight dict of the neighbor node
+        indptr : The row pointers of the CSR adjacency.
+        indices : The node ids of the neighbours in the CSR adjacency.
+        weights : The edge weights of the neighbours in the CSR adjacency, None if all of them are one.
+        nodes : The nodes of the graph indexed by node id.
         """
-        if graph.is_directed():
-            neighbours = {}
-            for node in graph:
-                neighbours[node] = defaultdict(float)
-                for _, n, wt in graph.out_edges(node, data=weight):
-                    neighbours[node][n] += wt * self.beta if wt else self.beta
-                for n, _, wt in graph.in_edges(node, data=weight):
-                    neighbours[node][n] += wt * self.alpha if wt else self.alpha
+        indptr, indices, weights, nodes = to_csr(graph, weight, alpha=self.alpha, beta=self.beta, reorder=True)
+        # Without weights, the label frequencies are plain counts. The kernels are then
+        # compiled without the reads of the weights.
+        if np.all(weights == 1.0):
+            weights = None
+        return indptr, indices, weights, nodes
+
+
+@njit(cache=True, boundscheck=False)
+def _best_labels(node: int,
+                 indptr: np.ndarray,
+                 indices: np.ndarray,
+                 weights: np.ndarray,
+                 labels: np.ndarray,
+                 label_freq: np.ndarray,
+                 mark: np.ndarray,
+                 touched: np.ndarray,
+                 best_labels: np.ndarray) -> Tuple[int, bool]:
+    """Collects the labels with maximum frequency among the neighbours of a node.
+
+    Only the labels touched by the neighbours are visited: `mark[label] == node`
+    tells whether `label_freq[label]` has been reset for `node`, and the touched
+    labels are listed in `touched`, so the scratch arrays never need a full reset.
+
+    Parameters
+    ----------
+    node : id of the node in 'graph'
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    weights : The edge weights of the neighbours in the CSR adjacency, None if all of them are one.
+    labels : An array indexed by node id to labels
+    label_freq : Scratch array of the label frequencies, of size n.
+    mark : Scratch array of the last node that touched each label, of size n.
+    touched : Scratch array of the touched labels, of size the maximum degree.
+    best_labels : Array of size the maximum degree, filled with the maximum frequency labels.
+
+    Returns
+    -------
+    n_best : The number of maximum frequency labels, 0 for nodes with no neighbors.
+    is_best : Whether the label of the node is one of them.
+    """
+    n_touched = 0
+    for k in range(indptr[node], indptr[node + 1]):
+        label = labels[indices[k]]
+        if mark[label] != node:
+            mark[label] = node
+            label_freq[label] = 0.0
+            touched[n_touched] = label
+            n_touched += 1
+        if weights is None:
+            label_freq[label] += 1.0
         else:
-            neighbours = {
-                node: {v: data.get(weight, 1) for v, data in graph[node].items() if v != node} for node in graph
-            }
+            label_freq[label] += weights[k]
+
+    if n_touched == 0:
+        return 0, True
+
+    max_freq = label_freq[touched[0]]
+    for i in range(1, n_touched):
+        max_freq = max(max_freq, label_freq[touched[i]])
+
+    n_best = 0
+    is_best = False
+    for i in range(n_touched):
+        label = touched[i]
+        if label_freq[label] == max_freq:
+            best_labels[n_best] = label
+            n_best += 1
+            is_best = is_best or label == labels[node]
+    return n_best, is_best
 
-        return neighbours
+
+@njit(cache=True, boundscheck=False)
+def _async_lpa_csr(indptr: np.ndarray,
+                   indices: np.ndarray,
+                   weights: np.ndarray,
+                   labels: np.ndarray,
+                   order: np.ndarray) -> bool:
+    """Runs one sweep of the asynchronous label propagation over a CSR adjacency.
+
+    The nodes are visited in a random order and `labels` is updated in place.
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    weights : The edge weights of the neighbours in the CSR adjacency, None if all of them are one.
+    labels : An array indexed by node id to labels
+    order : An array of node ids, shuffled in place before the sweep.
+
+    Returns
+    -------
+    Whether at least one node didn't have a maximum frequency label.
+    """
+    n = len(labels)
+    size = max_degree(indptr)
+    label_freq = np.zeros(n, dtype=np.float64)
+    mark = np.full(n, -1, dtype=np.int32)
+    touched = np.empty(size, dtype=np.int32)
+    best_labels = np.empty(size, dtype=np.int32)
+
+    cont = False
+    np.random.shuffle(order)
+    for node in order:
+        n_best, is_best = _best_labels(node, indptr, indices, weights, labels,
+                                       label_freq, mark, touched, best_labels)
+
+        # If the node does not have one of the maximum frequency labels,
+        # randomly choose one of them and update the node's label.
+        # Continue the iteration as long as at least one node
+        # doesn't have a maximum frequency label.
+        if not is_best:
+            labels[node] = best_labels[np.random.randint(n_best)]
+            cont = True
+
+    return cont
+
+
+@njit(cache=True, boundscheck=False)
+def _semi_lpa_csr(indptr: np.ndarray,
+                  indices: np.ndarray,
+                  weights: np.ndarray,
+                  labels: np.ndarray,
+                  order: np.ndarray) -> bool:
+    """Runs one sweep of the semi-synchronous label propagation over a CSR adjacency.
+
+    The labels are updated in place, in the given order, using the Prec-Max tie
+    breaking algorithm explained in: 'Community Detection via Semi-Synchronous
+    Label Propagation Algorithms' Cordasco and Gargano, 2011
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    weights : The edge weights of the neighbours in the CSR adjacency, None if all of them are one.
+    labels : An array indexed by node id to labels
+    order : An array of node ids grouped by color.
+
+    Returns
+    -------
+    Whether at least one label has changed.
+    """
+    n = len(labels)
+    size = max_degree(indptr)
+    label_freq = np.zeros(n, dtype=np.float64)
+    mark = np.full(n, -1, dtype=np.int32)
+    touched = np.empty(size, dtype=np.int32)
+    best_labels = np.empty(size, dtype=np.int32)
+
+    changed = False
+    for node in order:
+        n_best, is_best = _best_labels(node, indptr, indices, weights, labels,
+                                       label_freq, mark, touched, best_labels)
+
+        # Prec-Max: keep the label if it has maximum frequency, else take the largest one.
+        if not is_best:
+            labels[node] = best_labels[:n_best].max()
+            changed = True
+
+    return changed
+
+
+@njit(parallel=True, cache=True, boundscheck=False)
+def _sync_lpa_csr(indptr: np.ndarray,
+                  indices: np.ndarray,
+                  weights: np.ndarray,
+                  labels: np.ndarray,
+                  new_labels: np.ndarray) -> bool:
+    """Runs one sweep of the synchronous label propagation over a CSR adjacency.
+
+    Every node reads the labels of the previous sweep from `labels` and writes its
+    label to `new_labels`, so the nodes are updated in parallel. Ties are broken with
+    the Prec-Max rule: keep the current label if possible, else take the largest one.
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    weights : The edge weights of the neighbours in the CSR adjacency, None if all of them are one.
+    labels : An array indexed by node id to the labels of the previous sweep
+    new_labels : An array indexed by node id, filled with the updated labels
+
+    Returns
+    -------
+    Whether at least one label has changed.
+    """
+    n_changed = 0
+    for node in prange(len(labels)):
+        label = labels[node]
+        best_label = label
+        start, end = indptr[node], indptr[node + 1]
+        if start < end:
+            nbr_labels = labels[indices[start:end]]
+            order = np.argsort(nbr_labels)
+
+            # Sum the weights of each run of equal labels, in ascending label order.
+            best_freq = -np.inf
+            own_freq = -np.inf
+            i = 0
+            while i < len(order):
+                nbr_label = nbr_labels[order[i]]
+                freq = 0.0
+                while i < len(order) and nbr_labels[order[i]] == nbr_label:
+                    if weights is None:
+                        freq += 1.0
+                    else:
+                        freq += weights[start + order[i]]
+                    i += 1
+                if nbr_label == label:
+                    own_freq = freq
+                if freq >= best_freq:
+                    best_freq = freq
+                    best_label = nbr_label
+            if own_freq == best_freq:
+                best_label = label
+
+        new_labels[node] = best_label
+        if best_label != label:
+            n_changed += 1
+
+    return n_changed > 0
@@ -7,12 +7,13 @@ Reference implementation: https://github.com/networkx/networkx/blob/main/network
 
 
 import networkx as nx
-import random
-from collections import defaultdict, deque
-from networkx.algorithms.community import modularity
+import numpy as np
+from collections import deque
+from numba import njit
 from pyncd.models.base import BaseDetector
-from pyncd.utils.converter import convert_multigraph
-from pyncd.utils.tools import check_is_fitted
+from pyncd.utils.converter import RCM_MIN_NODES, convert_multigraph, edges_to_csr, permute_csr
+from pyncd.utils.converter import reverse_cuthill_mckee, to_edge_arrays
+from pyncd.utils.tools import check_is_fitted, group_labels, max_degree, set_numba_seed
 from typing import Union, List, Set, Any, Tuple, Iterator
 
 
@@ -41,7 +42,7 @@ class LouvainDetector(BaseDetector):
         between 2 levels of the algorithm is less than the given threshold
         then the algorithm stops and returns the resulting communities.
     random_state： int, optional (default=123)
-        the seed used by the random
+        the seed used by the random, set at the start of every fit
 
     Attributes
     ----------
@@ -59,11 +60,9 @@ class LouvainDetector(BaseDetector):
         self.resolution = resolution
         self.threshold = threshold
         self.random_state = random_state
-        random.seed(random_state)
 
-        self.decision_com_graph_ = None
-        self.decision_com_num_ = None
-        self.decision_com_node2com_ = None
+        self._is_directed = None
+        self._com_edges = None
 
     def fit(self, graph: nx.Graph, weight: Union[str, None] = "weight") -> object:
         """Fit detector. Find the best partition of a graph using the Louvain Community Detection Algorithm.
@@ -86,14 +85,10 @@ class LouvainDetector(BaseDetector):
         The order in which the nodes are considered can affect the final output. In the algorithm
         the ordering happens using a random shuffle.
         """
-        generator = self.gen_partition(graph, weight)
-        queue = deque(generator, maxlen=1)
-        self.decision_com_graph_ = queue.pop()[0]
-        self.decision_com_num_ = len(self.decision_com_graph_)
-        self.decision_com_node2com_ = {}
-        for com, attr in self.decision_com_graph_.nodes(data=True):
-            for node in attr["nodes"]:
-                self.decision_com_node2com_[node] = com
+        self._is_directed = graph.is_directed()
+        queue = deque(self._gen_levels(graph, weight), maxlen=1)
+        _, labels, self._com_edges = queue.pop()
+        self._set_partition(list(graph), labels)
 
         return self
 
@@ -114,16 +109,17 @@ class LouvainDetector(BaseDetector):
         >>> G = nx.petersen_graph()
         >>> detector = LouvainDetector()
         >>> detector.fit(G)
+        LouvainDetector
         >>> detector.decision_function([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
-        [0, 1, 1, 1, 0, 0, 1, 0, 1, 0]
+        [0, 0, 1, 1, 0, 1, 0, 1, 1, 0]
         """
-        check_is_fitted(self, ["decision_com_graph_", "decision_com_num_", "decision_com_node2com_"])
-        return [self.decision_com_node2com_[node] for node in nodes]
+        check_is_fitted(self)
+        return self._labels_of(nodes).tolist()
 
     def gen_partition(
             self,
             graph: nx.Graph,
-            weight: Union[str, None] = "weight") -> Iterator[Tuple[nx.Graph, List[Set[Any]]]]:
+            weight: Union[str, None] = "weight") -> Iterator[Tuple[List[Set[Any]], List[Set[Any]]]]:
         """Partition generator
 
         Parameters
@@ -136,194 +132,321 @@ class LouvainDetector(BaseDetector):
 
         Yields
         ------
-        new_graph
-            Each node represents one community and contains all the nodes that constitute it.
+        partition
+            These node sets represent a partition of graph's nodes. Each set contains
+            all the nodes that constitute one community at the level.
         inner_partition
-            These node sets represent a partition of graph's nodes.
+            These node sets represent a partition of the nodes of the level, i.e. the
+            nodes of `graph` at the first level and the previous communities index after.
         """
-        partition = [{u} for u in graph.nodes()]
-        mod = modularity(graph, partition,
-                         resolution=self.resolution, weight=weight)
+        nodes = list(graph)
+        level_nodes = nodes
+        for node2com, leaf2com, _ in self._gen_levels(graph, weight):
+            inner_partition = [{level_nodes[i] for i in members.tolist()} for members in group_labels(node2com)]
+            partition = [{nodes[i] for i in members.tolist()} for members in group_labels(leaf2com)]
+            yield partition, inner_partition
+            level_nodes = range(len(inner_partition))
+
+    def _gen_levels(
+            self,
+            graph: nx.Graph,
+            weight: Union[str, None] = "weight") -> Iterator[Tuple[np.ndarray, np.ndarray, Tuple[np.ndarray, ...]]]:
+        """Level generator working on the edge lists of the coarsened graphs
+
+        Parameters
+        ----------
+        graph : NetworkX graph
+            The graph from which to detect communities
+        weight : string or None, optional (default="weight")
+            The name of an edge attribute that holds the numerical value
+            used as a weight. If None then each edge has weight 1.
+
+        Yields
+        ------
+        node2com
+            The communities index of the nodes of the level.
+        leaf2com
+            The communities index of the nodes of `graph`, following the order of `graph`.
+        com_edges
+            The (src, dst, weights) edge list of the graph whose nodes are the communities.
+        """
+        set_numba_seed(self.random_state)
         is_directed = graph.is_directed()
+        # Plain graphs are read in place by the array builders, only the parallel edges of
+        # a multigraph have to be merged into a new graph first.
         if graph.is_multigraph():
-            new_graph = convert_multigraph(graph, weight, is_directed)
+            graph = convert_multigraph(graph, weight, 1, is_directed)
+            weight = "weight"
+
+        src, dst, wts, _ = to_edge_arrays(graph, weight)
+        n = len(graph)
+
+        m = wts.sum()
+        leaf2com = np.arange(n, dtype=np.int32)
+        level = self._level_arrays(n, src, dst, wts, is_directed)
+        if n >= RCM_MIN_NODES:
+            # Sweep the first level in the reverse Cuthill-McKee order. The communities are
+            # numbered in that order, so the coarsened levels inherit its locality.
+            perm = reverse_cuthill_mckee(level[0], level[1])
+            level = permute_csr(level[0], level[1], level[2], perm) + (level[3][perm], level[4][perm])
+            node2com, gain = self.one_level(*level, m, self.resolution, is_directed)
+            rank = np.empty(n, dtype=np.int32)
+            rank[perm] = np.arange(n, dtype=np.int32)
+            node2com = node2com[rank]
         else:
-            new_graph = graph.__class__()
-            new_graph.add_nodes_from(graph)
-            new_graph.add_weighted_edges_from(
-                graph.edges(data=weight, default=1))
-
-        m = new_graph.size(weight="weight")
-        partition, inner_partition, improvement = self.one_level(
-            new_graph, m, partition, "weight", self.resolution, is_directed
-        )
+            node2com, gain = self.one_level(*level, m, self.resolution, is_directed)
         improvement = True
         while improvement:
-            new_mod = modularity(
-                new_graph, inner_partition, resolution=self.resolution
-            )
-
-            new_graph = self.gen_graph(new_graph, inner_partition)
-            yield new_graph, inner_partition
+            n = int(node2com.max()) + 1 if n > 0 else 0
+            src, dst, wts = _coarsen_edges(node2com, n, src, dst, wts, is_directed)
+            leaf2com = node2com[leaf2com]
+            yield node2com, leaf2com, (src, dst, wts)
 
-            if new_mod - mod <= self.threshold:
+            # The gains of the moves add up to the modularity gain of the level.
+            if gain <= self.threshold:
                 return
-            mod = new_mod
 
-            partition, inner_partition, improvement = self.one_level(
-                new_graph, m, partition, "weight", self.resolution, is_directed
-            )
+            node2com, gain = self.one_level(*self._level_arrays(n, src, dst, wts, is_directed),
+                                            m, self.resolution, is_directed)
+            improvement = gain > 0
+
+    @staticmethod
+    def _level_arrays(
+            n: int,
+            src: np.ndarray,
+            dst: np.ndarray,
+            wts: np.ndarray,
+            is_directed: bool) -> Tuple[np.ndarray, ...]:
+        """Build the CSR adjacency and the weighted degrees of the graph of a level from its edge list
+
+        Returns
+        -------
+        indptr, indices, weights
+            The CSR adjacency of the neighbours, without self-loops.
+        in_degrees, out_degrees
+            The weighted in and out degrees of the nodes, both are the weighted degrees
+            for undirected graphs.
+        """
+        indptr, indices, weights = edges_to_csr(n, src, dst, wts)
+        out_degrees = np.bincount(src, weights=wts, minlength=n)
+        in_degrees = np.bincount(dst, weights=wts, minlength=n)
+        if not is_directed:
+            in_degrees = out_degrees = in_degrees + out_degrees
+        return indptr, indices, weights, in_degrees, out_degrees
 
     @staticmethod
     def one_level(
-            graph: nx.Graph,
-            graph_size: int,
-            partition: List[Set[Any]],
-            weight: Union[str, None] = None,
+            indptr: np.ndarray,
+            indices: np.ndarray,
+            weights: np.ndarray,
+            in_degrees: np.ndarray,
+            out_degrees: np.ndarray,
+            graph_size: float,
             resolution: float = 1,
-            is_directed: bool = False) -> Tuple[List[Set[Any]], List[Set[Any]], bool]:
+            is_directed: bool = False) -> Tuple[np.ndarray, float]:
         """Calculate one level of the Louvain partitions tree
 
         Parameters
         ----------
-        graph : NetworkX Graph or DiGraph
-            The graph from which to detect communities
-        graph_size : number
-            The size of the graph `graph`.
-        partition : list of sets of nodes
-            A valid partition of the graph `graph`
-        weight: string or None, optional (default=None)
-            The name of an edge attribute that holds the numerical value used as a weight.
-            If None, then each edge has weight 1.
+        indptr : int array of shape (n + 1,)
+            The row pointers of the CSR adjacency of the graph from which to detect communities.
+        indices : int32 array
+            The node ids of the neighbours in the CSR adjacency.
+        weights : float64 array
+            The edge weights of the neighbours in the CSR adjacency.
+        in_degrees : float64 array of shape (n,)
+            The weighted in degrees of the nodes, or the weighted degrees for undirected graphs.
             The degree is the sum of the edge weights adjacent to the node.
+        out_degrees : float64 array of shape (n,)
+            The weighted out degrees of the nodes, ignored for undirected graphs.
+        graph_size : number
+            The size of the graph.
         resolution : positive number
             The resolution parameter for computing the modularity of a partition
         is_directed : bool
-            True if `graph` is a directed graph.
+            True if the graph is a directed graph.
 
         Returns
         -------
-        partition
-            A list of sets of nodes. A valid partition of the graph `graph` at the level.
-        inner_partition
-            A list of sets. These node sets represent a partition of graph's nodes.
-        improvement
-            Whether the modularity gain is obtained.
+        node2com
+            The communities index of the nodes at the level, numbered from 0.
+        gain
+            The modularity gain obtained at the level, 0 if no node has moved.
         """
-        node2com = {node: i for i, node in enumerate(graph.nodes())}
-        inner_partition = [{node} for node in graph.nodes()]
-        if is_directed:
-            in_degrees = dict(graph.in_degree(weight=weight))
-            out_degrees = dict(graph.out_degree(weight=weight))
-            stot_in = [deg for deg in in_degrees.values()]
-            stot_out = [deg for deg in out_degrees.values()]
-            # Calculate weights for both in and out neighbours
-            neighbours = {}
-            for node in graph:
-                neighbours[node] = defaultdict(float)
-                for _, n, wt in graph.out_edges(node, data=weight):
-                    neighbours[node][n] += wt if wt else 1
-                for n, _, wt in graph.in_edges(node, data=weight):
-                    neighbours[node][n] += wt if wt else 1
-        else:
-            degrees = dict(graph.degree(weight=weight))
-            stot = [deg for deg in degrees.values()]
-            neighbours = {node: {v: data.get(
-                weight, 1) for v, data in graph[node].items() if v != node} for node in graph}
-        rand_nodes = list(graph.nodes)
-        random.shuffle(rand_nodes)
-        nb_moves = 1
-        improvement = False
-        while nb_moves > 0:
-            nb_moves = 0
-            for node in rand_nodes:
-                best_mod = 0
-                best_com = node2com[node]
-
-                # Calculate weights between node and its neighbor communities.
-                weights2com = defaultdict(float)
-                for nbr, wt in neighbours[node].items():
-                    weights2com[node2com[nbr]] += wt
+        n = len(indptr) - 1
+        node2com = np.arange(n, dtype=np.int32)
+        order = np.arange(n, dtype=np.int32)
+        gain = _one_level_csr(indptr, indices, weights, node2com, in_degrees, out_degrees,
+                              graph_size, resolution, is_directed, order)
 
-                if is_directed:
-                    in_degree = in_degrees[node]
-                    out_degree = out_degrees[node]
-                    stot_in[best_com] -= in_degree
-                    stot_out[best_com] -= out_degree
-                    remove_cost = (
-                            -weights2com[best_com] / graph_size
-                            + resolution
-                            * (out_degree * stot_in[best_com] + in_degree * stot_out[best_com])
-                            / graph_size ** 2
-                    )
-                else:
-                    degree = degrees[node]
-                    stot[best_com] -= degree
-                    remove_cost = -weights2com[best_com] / graph_size + resolution * (
-                            stot[best_com] * degree) / (2 * graph_size ** 2)
-                for nbr_com, wt in weights2com.items():
-                    if is_directed:
-                        gain = (
-                                remove_cost
-                                + wt / graph_size
-                                - resolution
-                                * (
-                                        out_degree * stot_in[nbr_com]
-                                        + in_degree * stot_out[nbr_com]
-                                )
-                                / graph_size ** 2
-                        )
-                    else:
-                        gain = (remove_cost + wt / graph_size - resolution *
-                                (stot[nbr_com] * degree) / (2 * graph_size ** 2))
-                    if gain > best_mod:
-                        best_mod = gain
-                        best_com = nbr_com
-                if is_directed:
-                    stot_in[best_com] += in_degree
-                    stot_out[best_com] += out_degree
-                else:
-                    stot[best_com] += degree
-                if best_com != node2com[node]:
-                    com = graph.nodes[node].get("nodes", {node})
-                    partition[node2com[node]].difference_update(com)
-                    inner_partition[node2com[node]].remove(node)
-                    partition[best_com].update(com)
-                    inner_partition[best_com].add(node)
-                    improvement = True
-                    nb_moves += 1
-                    node2com[node] = best_com
-        partition = list(filter(len, partition))
-        inner_partition = list(filter(len, inner_partition))
-        return partition, inner_partition, improvement
+        _, node2com = np.unique(node2com, return_inverse=True)
+        return node2com.astype(np.int32), gain
 
-    @staticmethod
-    def gen_graph(graph: nx.Graph, partition: List[Set[Any]]) -> nx.Graph:
-        """Generate a new graph based on the partitions of a given graph
+    def _gen_com_graph(self, com_graph: nx.Graph = None) -> nx.Graph:
+        """Generate the graph of best communities from the fitted partition
 
         Parameters
         ----------
-        graph : NetworkX Graph
-        partition : list of sets
-            A valid partition of the graph `graph` at the level.
+        com_graph : NetworkX Graph, optional (default=None)
+            The empty graph to fill. If None, a Graph or DiGraph following the fitted graph.
 
         Returns
         -------
-        NetworkX Graph
+        NetworkX Graph or DiGraph
+            Each node represents one community and contains all the nodes that constitute it.
+            The edges hold the summed weights of the edges between the communities.
         """
-        new_graph = graph.__class__()
-        node2com = {}
-        for i, part in enumerate(partition):
-            nodes = set()
-            for node in part:
-                node2com[node] = i
-                nodes.update(graph.nodes[node].get("nodes", {node}))
-            new_graph.add_node(i, nodes=nodes)
-
-        for node1, node2, wt in graph.edges(data=True):
-            wt = wt["weight"]
-            com1 = node2com[node1]
-            com2 = node2com[node2]
-            temp = new_graph.get_edge_data(com1, com2, {"weight": 0})["weight"]
-            new_graph.add_edge(com1, com2, **{"weight": wt + temp})
-        return new_graph
+        if com_graph is None:
+            com_graph = nx.DiGraph() if self._is_directed else nx.Graph()
+        com_graph = super(LouvainDetector, self)._gen_com_graph(com_graph)
+        src, dst, wts = self._com_edges
+        com_graph.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), wts.tolist()))
+        return com_graph
+
+
+def _coarsen_edges(
+        node2com: np.ndarray,
+        n_coms: int,
+        src: np.ndarray,
+        dst: np.ndarray,
+        wts: np.ndarray,
+        is_directed: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Generate the edge list of the graph whose nodes are the communities of a given graph
+
+    The edge weights are scattered onto the community pairs, keyed by `com1 * n_coms + com2`.
+    The edges inside a community become a self-loop of the community.
+
+    Parameters
+    ----------
+    node2com : The communities index of the nodes.
+    n_coms : The number of communities.
+    src : The source of the edges.
+    dst : The target of the edges.
+    wts : The weights of the edges.
+    is_directed : True if the graph is a directed graph.
+
+    Returns
+    -------
+    The (src, dst, weights) edge list of the communities, sorted by source then target.
+    """
+    com1 = node2com[src].astype(np.int64)
+    com2 = node2com[dst].astype(np.int64)
+    if not is_directed:
+        com1, com2 = np.minimum(com1, com2), np.maximum(com1, com2)
+    keys, inverse = np.unique(com1 * n_coms + com2, return_inverse=True)
+    agg = np.bincount(inverse, weights=wts, minlength=len(keys))
+    return (keys // n_coms).astype(np.int32), (keys % n_coms).astype(np.int32), agg
+
+
+@njit(cache=True, boundscheck=False)
+def _one_level_csr(indptr: np.ndarray,
+                   indices: np.ndarray,
+                   weights: np.ndarray,
+                   node2com: np.ndarray,
+                   in_degrees: np.ndarray,
+                   out_degrees: np.ndarray,
+                   graph_size: float,
+                   resolution: float,
+                   is_directed: bool,
+                   order: np.ndarray) -> float:
+    """Moves the nodes of a CSR adjacency between communities until no move improves the modularity.
+
+    The nodes are visited in a random order and `node2com` is updated in place.
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    weights : The edge weights of the neighbours in the CSR adjacency.
+    node2com : An array indexed by node id to communities index.
+    in_degrees : The weighted in degrees of the nodes. For undirected graphs, the weighted degrees.
+    out_degrees : The weighted out degrees of the nodes. Ignored for undirected graphs.
+    graph_size : The size of the graph.
+    resolution : The resolution parameter for computing the modularity of a partition
+    is_directed : True if the graph is a directed graph.
+    order : An array of node ids, shuffled in place before the first pass.
+
+    Returns
+    -------
+    The modularity gain, i.e. the sum of the gains of the accepted moves.
+    """
+    n = len(node2com)
+
+    # The total degrees of the communities. For undirected graphs only `stot_in` is used.
+    stot_in = np.zeros(n, dtype=np.float64)
+    stot_out = np.zeros(n, dtype=np.float64)
+    for node in range(n):
+        stot_in[node2com[node]] += in_degrees[node]
+        stot_out[node2com[node]] += out_degrees[node]
+
+    # Weights between the visited node and its neighbor communities. `mark[com] == stamp`
+    # tells whether `weights2com[com]` has been reset for the current visit.
+    weights2com = np.zeros(n, dtype=np.float64)
+    mark = np.full(n, -1, dtype=np.int64)
+    touched = np.empty(max_degree(indptr), dtype=np.int32)
+    stamp = 0
+
+    # The scale factors of the gains are constant over the level, they are hoisted out
+    # of the scans so that the inner loop is left with multiply-adds.
+    inv_size = 1.0 / graph_size if graph_size > 0 else 0.0
+    if is_directed:
+        degree_scale = resolution * inv_size * inv_size
+    else:
+        degree_scale = 0.5 * resolution * inv_size * inv_size
+
+    np.random.shuffle(order)
+    total_gain = 0.0
+    nb_moves = 1
+    while nb_moves > 0:
+        nb_moves = 0
+        for node in order:
+            stamp += 1
+            n_touched = 0
+            for k in range(indptr[node], indptr[node + 1]):
+                com = node2com[indices[k]]
+                if mark[com] != stamp:
+                    mark[com] = stamp
+                    weights2com[com] = 0.0
+                    touched[n_touched] = com
+                    n_touched += 1
+                weights2com[com] += weights[k]
+
+            # The totals of the node's community are taken without the node itself,
+            # as local scalars instead of a remove-then-restore on the arrays.
+            node_com = node2com[node]
+            weight2com = weights2com[node_com] if mark[node_com] == stamp else 0.0
+            in_degree = in_degrees[node]
+            out_degree = out_degrees[node]
+            if is_directed:
+                own_in = stot_in[node_com] - in_degree
+                own_out = stot_out[node_com] - out_degree
+                remove_cost = -weight2com * inv_size + degree_scale * (out_degree * own_in + in_degree * own_out)
+            else:
+                own_in = stot_in[node_com] - in_degree
+                remove_cost = -weight2com * inv_size + degree_scale * own_in * in_degree
+
+            best_mod = 0.0
+            best_com = node_com
+            for i in range(n_touched):
+                com = touched[i]
+                com_in = own_in if com == node_com else stot_in[com]
+                if is_directed:
+                    com_out = own_out if com == node_com else stot_out[com]
+                    gain = (remove_cost + weights2com[com] * inv_size
+                            - degree_scale * (out_degree * com_in + in_degree * com_out))
+                else:
+                    gain = remove_cost + weights2com[com] * inv_size - degree_scale * com_in * in_degree
+                if gain > best_mod:
+                    best_mod = gain
+                    best_com = com
+
+            if best_com != node_com:
+                stot_in[node_com] -= in_degree
+                stot_in[best_com] += in_degree
+                stot_out[node_com] -= out_degree
+                stot_out[best_com] += out_degree
+                node2com[node] = best_com
+                total_gain += best_mod
+                nb_moves += 1
+
+    return total_gain
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Make certain functions from some of the previous subpackages available
+to the user as direct imports from the `pyncd.utils` namespace.
+"""
+from pyncd.utils.converter import convert_multigraph
+from pyncd.utils.converter import edges_to_csr
+from pyncd.utils.converter import to_csr
+from pyncd.utils.converter import to_edge_arrays
+
+__all__ = ["convert_multigraph", "edges_to_csr", "to_csr", "to_edge_arrays"]
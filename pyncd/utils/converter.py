@@ -5,17 +5,28 @@
 # License: BSD 2 clause
 
 import networkx as nx
-from typing import Any, Iterable, Union, Optional
+import numpy as np
+from itertools import chain, compress, repeat
+from numba import njit
+from operator import eq, methodcaller
+from typing import Any, Iterable, Union, Optional, List, Tuple
+
+# Below this number of nodes the adjacency fits in cache and reordering does not pay off.
+RCM_MIN_NODES = 1024
 
 
 def convert_multigraph(
         graph: Iterable[Any],
-        weight: Optional[Union[str, bool]] = False,
-        default: Union[int, float] = None,
+        weight: Union[str, None] = "weight",
+        default: Union[int, float] = 1,
         is_directed: bool = False,
+        backend: Optional[str] = None,
         **kwargs) -> Union[nx.Graph, nx.DiGraph]:
     """Convert a MultiGraph to normal Graph
 
+    A Graph or DiGraph of the requested kind is copied edge by edge with its weights
+    stored in the "weight" attribute, as it has no parallel edges.
+
     Parameters
     ----------
     graph : iterable container
@@ -23,15 +34,16 @@ def convert_multigraph(
         OR
         A container of (node, attribute dict) tuples.
         Node attributes are updated using the attribute dict.
-    weight : string or bool, optional (default=False)
-        The edge attribute returned in 3-tuple (u, v, dict[data]).
-        If True, return edge attribute dict in 3-tuple (u, v, dict).
-        If False, return 2-tuple (u, v).
-    default: value, optional (default=None)
+    weight : string or None, optional (default="weight")
+        The edge attribute representing the weight of an edge.
+        If None, each edge is assumed to have weight `default`.
+    default: value, optional (default=1)
         Value used for edges that don’t have the requested attribute.
-        Only relevant if data is not True or False.
     is_directed : bool, optional (default=False)
         Indicates whether the graph is directed.
+    backend : string, optional (default=None)
+        The engine summing the weights of the parallel edges. If None, NumPy.
+        If "igraph", the C core of python-igraph, which has to be installed.
     kwargs : keyword arguments, optional (default= no attributes)
         Update attributes for all nodes in nodes.
         Node attributes specified in nodes as a tuple take
@@ -40,15 +52,388 @@ def convert_multigraph(
     Returns
     -------
         NetworkX Graph or DiGraph (`weight` defaults to the name of the edge weights)
+
+    Raises
+    ------
+    ValueError
+        If `weight` is a bool or `default` is None, as the edges would have no numerical weight.
     """
-    if is_directed:
-        new_graph = nx.DiGraph()
-    else:
-        new_graph = nx.Graph()
+    if isinstance(weight, bool) or default is None:
+        raise ValueError("`weight` must be an edge attribute name or None and `default` a number")
+    new_graph = nx.DiGraph() if is_directed else nx.Graph()
     new_graph.add_nodes_from(graph, **kwargs)
-    for u, v, wt in graph.edges(data=weight, default=default):
-        if new_graph.has_edge(u, v):
-            new_graph[u][v]["weight"] += wt
-        else:
-            new_graph.add_edge(u, v, weight=wt)
+    if backend is None and not graph.is_multigraph() and graph.is_directed() == is_directed:
+        # A simple graph of the requested kind has no parallel edges to merge.
+        new_graph.add_weighted_edges_from(graph.edges(data=weight, default=default))
+        return new_graph
+
+    if backend is None:
+        # The parallel edges of a multigraph are merged while reading its adjacency.
+        src, dst, wts, nodes = to_edge_arrays(graph, weight, default)
+        n = len(nodes)
+        if graph.is_directed() and not is_directed:
+            # The reciprocal edges of a directed graph become one undirected edge.
+            src, dst = np.minimum(src, dst), np.maximum(src, dst)
+            keys, inverse = np.unique(src.astype(np.int64) * n + dst, return_inverse=True)
+            wts = np.bincount(inverse, weights=wts, minlength=len(keys))
+            src, dst = (keys // n).astype(np.int32), (keys % n).astype(np.int32)
+    elif backend == "igraph":
+        ig = import_igraph()
+        # igraph is given every parallel edge of a multigraph and merges them itself.
+        src, dst, wts, nodes = _adjacency_arrays(graph, weight, default, once=not graph.is_directed(),
+                                                 merge=False)
+        ig_graph = ig.Graph(n=len(nodes), edges=np.column_stack((src, dst)).tolist(), directed=is_directed,
+                            edge_attrs={"weight": wts.tolist()})
+        ig_graph.simplify(multiple=True, loops=False, combine_edges="sum")
+        edges = np.array(ig_graph.get_edgelist(), dtype=np.int32).reshape(-1, 2)
+        src, dst = edges[:, 0], edges[:, 1]
+        wts = np.array(ig_graph.es["weight"], dtype=np.float64)
+    else:
+        raise NotImplementedError(f"`{backend}` is not implemented")
+
+    new_graph.add_weighted_edges_from(zip(map(nodes.__getitem__, src.tolist()),
+                                          map(nodes.__getitem__, dst.tolist()), wts.tolist()))
     return new_graph
+
+
+def import_igraph() -> Any:
+    """Import python-igraph, an optional dependency used by the "igraph" backends
+
+    Returns
+    -------
+    The igraph module.
+    """
+    try:
+        import igraph
+    except ImportError as e:
+        raise ImportError("The `igraph` backend requires python-igraph, "
+                          "install it with `pip install igraph`.") from e
+    return igraph
+
+
+def to_csr(
+        graph: Union[nx.Graph, nx.DiGraph],
+        weight: Union[str, None] = "weight",
+        alpha: float = 1.0,
+        beta: float = 1.0,
+        reorder: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Any]]:
+    """Convert the neighbourhoods of a graph to a compressed sparse row (CSR) adjacency
+
+    Each node is given an integer id following the iteration order of `graph`. The
+    neighbours of the node `i` are ``indices[indptr[i]:indptr[i + 1]]`` and the matching
+    edge weights are ``weights[indptr[i]:indptr[i + 1]]``. Self-loops are dropped. For
+    directed graphs, the successors and predecessors of a node are merged into a single
+    neighbourhood.
+
+    With `reorder`, graphs of at least `RCM_MIN_NODES` nodes get their integer ids in the
+    reverse Cuthill-McKee order instead, so that the neighbours of a node are stored close
+    to each other.
+
+    Parameters
+    ----------
+    graph : NetworkX Graph or DiGraph
+    weight : string or None, optional (default="weight")
+        The edge attribute representing the weight of an edge.
+        If None, each edge is assumed to have weight one.
+    alpha : float, optional (default=1.0)
+        The factor of the weights of the in edges, which takes effect in a directed graph.
+    beta : float, optional (default=1.0)
+        The factor of the weights of the out edges, which takes effect in a directed graph.
+    reorder : bool, optional (default=False)
+        If True, number the nodes of large graphs in the reverse Cuthill-McKee order.
+
+    Returns
+    -------
+    indptr : int32 array of shape (n + 1,)
+        The row pointers of the CSR adjacency.
+    indices : int32 array of shape (nnz,)
+        The integer ids of the neighbours.
+    weights : float64 array of shape (nnz,)
+        The edge weights of the neighbours.
+    nodes : list
+        The nodes of `graph` indexed by their integer ids.
+    """
+    if graph.is_directed():
+        src, dst, wts, nodes = to_edge_arrays(graph, weight)
+        indptr, indices, weights = edges_to_csr(len(nodes), src, dst, wts, alpha=alpha, beta=beta)
+    else:
+        # The adjacency of an undirected graph already is the CSR, less the self-loops.
+        src, dst, wts, nodes = _adjacency_arrays(graph, weight)
+        mask = src != dst
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src[mask], minlength=len(nodes)), out=indptr[1:])
+        indices, weights = dst[mask], wts[mask]
+
+    if reorder and len(nodes) >= RCM_MIN_NODES:
+        perm = reverse_cuthill_mckee(indptr, indices)
+        indptr, indices, weights = permute_csr(indptr, indices, weights, perm)
+        nodes = [nodes[i] for i in perm.tolist()]
+    return indptr, indices, weights, nodes
+
+
+def to_edge_arrays(
+        graph: Union[nx.Graph, nx.DiGraph],
+        weight: Union[str, None] = "weight",
+        default: Union[int, float] = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Any]]:
+    """Convert the edges of a graph to integer id arrays with a single pass over the edge view
+
+    Each node is given an integer id following the iteration order of `graph`.
+
+    Parameters
+    ----------
+    graph : NetworkX Graph or DiGraph
+    weight : string or None, optional (default="weight")
+        The edge attribute representing the weight of an edge.
+        If None, each edge is assumed to have weight `default`.
+    default : value, optional (default=1)
+        Value used for edges that don't have the requested attribute.
+
+    Returns
+    -------
+    src : int32 array of shape (m,)
+        The integer ids of the source of the edges.
+    dst : int32 array of shape (m,)
+        The integer ids of the target of the edges.
+    weights : float64 array of shape (m,)
+        The weights of the edges.
+    nodes : list
+        The nodes of `graph` indexed by their integer ids.
+    """
+    return _adjacency_arrays(graph, weight, default, once=not graph.is_directed())
+
+
+def _adjacency_arrays(
+        graph: Union[nx.Graph, nx.DiGraph],
+        weight: Union[str, None] = "weight",
+        default: Union[int, float] = 1,
+        once: bool = False,
+        merge: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Any]]:
+    """Read the entries of the (successor) adjacency of a graph into integer id arrays
+
+    The adjacency is walked row by row with `map` and `np.fromiter`, so that no tuple is
+    built per edge. The entries are ordered by row, i.e. `src` is non-decreasing. The
+    weights of the parallel edges of a multigraph are summed into their entry, unless
+    `merge` is False, in which case each of them is an entry of its own. With `once`,
+    only the entries with ``src <= dst`` are kept, i.e. every undirected edge once.
+
+    Parameters
+    ----------
+    graph : NetworkX Graph or DiGraph
+    weight : string or None, optional (default="weight")
+        The edge attribute representing the weight of an edge.
+        If None, each edge is assumed to have weight `default`.
+    default : value, optional (default=1)
+        Value used for edges that don't have the requested attribute.
+    once : bool, optional (default=False)
+        If True, keep only the entries with ``src <= dst``.
+    merge : bool, optional (default=True)
+        If True, sum the weights of the parallel edges of a multigraph into one entry.
+
+    Returns
+    -------
+    src : int32 array of shape (nnz,)
+        The integer ids of the rows of the adjacency entries.
+    dst : int32 array of shape (nnz,)
+        The integer ids of the neighbours of the adjacency entries.
+    weights : float64 array of shape (nnz,)
+        The weights of the adjacency entries.
+    nodes : list
+        The nodes of `graph` indexed by their integer ids.
+    """
+    nodes = list(graph)
+    n = len(nodes)
+    adj = getattr(graph, "_adj", None)
+    rows = list(map((graph.adj if adj is None else adj).__getitem__, nodes))
+    degrees = np.fromiter(map(len, rows), dtype=np.int64, count=n)
+    nnz = int(degrees.sum())
+
+    src = np.repeat(np.arange(n, dtype=np.int32), degrees)
+    nbrs = chain.from_iterable(rows)
+    if all(map(eq, nodes, range(n))):
+        # Nodes labelled 0..n-1 in iteration order are their own integer ids.
+        dst = np.fromiter(nbrs, dtype=np.int32, count=nnz)
+    else:
+        node2idx = {node: i for i, node in enumerate(nodes)}
+        dst = np.fromiter(map(node2idx.__getitem__, nbrs), dtype=np.int32, count=nnz)
+
+    # The edge data are plain dicts, their unbound `get` is the cheapest lookup to map.
+    datas = chain.from_iterable(map(methodcaller("values"), rows))
+    if once:
+        # The data of the other direction is the same dict, it is not read twice.
+        mask = src <= dst
+        src, dst = src[mask], dst[mask]
+        datas = compress(datas, mask.tolist())
+        nnz = len(src)
+    if graph.is_multigraph():
+        # The entries hold the {key: data} dicts of the parallel edges.
+        keydicts = list(datas)
+        counts = np.fromiter(map(len, keydicts), dtype=np.int64, count=nnz)
+        datas = chain.from_iterable(map(methodcaller("values"), keydicts))
+        wts = np.fromiter(map(dict.get, datas, repeat(weight), repeat(default)),
+                          dtype=np.float64, count=int(counts.sum()))
+        if merge:
+            wts = np.bincount(np.repeat(np.arange(nnz), counts), weights=wts, minlength=nnz)
+        else:
+            src, dst = np.repeat(src, counts), np.repeat(dst, counts)
+    else:
+        wts = np.fromiter(map(dict.get, datas, repeat(weight), repeat(default)), dtype=np.float64, count=nnz)
+    return src, dst, wts, nodes
+
+
+def edges_to_csr(
+        n: int,
+        src: np.ndarray,
+        dst: np.ndarray,
+        weights: np.ndarray,
+        alpha: float = 1.0,
+        beta: float = 1.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert an edge list to the compressed sparse row (CSR) adjacency of the neighbours of every node
+
+    Both endpoints of an edge are neighbours of each other. The weights of parallel and
+    reciprocal edges are summed and self-loops are dropped.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes, the edge endpoints are integer ids in ``range(n)``.
+    src : int array of shape (m,)
+        The source of the edges.
+    dst : int array of shape (m,)
+        The target of the edges.
+    weights : float array of shape (m,)
+        The weights of the edges.
+    alpha : float, optional (default=1.0)
+        The factor of the weights seen from the target of the edges.
+    beta : float, optional (default=1.0)
+        The factor of the weights seen from the source of the edges.
+
+    Returns
+    -------
+    indptr : int32 array of shape (n + 1,)
+        The row pointers of the CSR adjacency.
+    indices : int32 array of shape (nnz,)
+        The integer ids of the neighbours, sorted within every row.
+    weights : float64 array of shape (nnz,)
+        The edge weights of the neighbours.
+    """
+    mask = src != dst
+    rows = np.concatenate((src[mask], dst[mask])).astype(np.int64)
+    cols = np.concatenate((dst[mask], src[mask])).astype(np.int64)
+    keys, inverse = np.unique(rows * n + cols, return_inverse=True)
+    wts = np.asarray(weights, dtype=np.float64)[mask]
+    data = np.bincount(inverse, weights=np.concatenate((wts * beta, wts * alpha)), minlength=len(keys))
+
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(np.bincount(keys // n, minlength=n), out=indptr[1:])
+    return indptr, (keys % n).astype(np.int32), data
+
+
+def reverse_cuthill_mckee(indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Compute the reverse Cuthill-McKee ordering of a symmetric CSR adjacency
+
+    Every connected component is visited breadth first from one of its nodes of lowest
+    degree, the neighbours being queued by increasing degree. Reversing the visit order
+    reduces the bandwidth of the adjacency.
+
+    Parameters
+    ----------
+    indptr : int32 array of shape (n + 1,)
+        The row pointers of the CSR adjacency.
+    indices : int32 array of shape (nnz,)
+        The integer ids of the neighbours.
+
+    Returns
+    -------
+    perm : int32 array of shape (n,)
+        The old id of the node given the new id ``i`` at ``perm[i]``.
+    """
+    degrees = np.diff(indptr).astype(np.int32)
+    starts = np.argsort(degrees, kind="stable").astype(np.int32)
+    return _rcm_csr(indptr, indices, degrees, starts)
+
+
+def permute_csr(
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        perm: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Renumber the nodes of a CSR adjacency
+
+    Parameters
+    ----------
+    indptr : int32 array of shape (n + 1,)
+        The row pointers of the CSR adjacency.
+    indices : int32 array of shape (nnz,)
+        The integer ids of the neighbours.
+    weights : float64 array of shape (nnz,)
+        The edge weights of the neighbours.
+    perm : int array of shape (n,)
+        The old id of the node given the new id ``i`` at ``perm[i]``.
+
+    Returns
+    -------
+    The (indptr, indices, weights) CSR adjacency in the new ids, the neighbours of a node
+    keep their order.
+    """
+    n = len(perm)
+    rank = np.empty(n, dtype=np.int32)
+    rank[perm] = np.arange(n, dtype=np.int32)
+
+    counts = np.diff(indptr)[perm]
+    new_indptr = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(counts, out=new_indptr[1:])
+    # Position of every new entry in the old arrays: the start of its old row plus its offset.
+    gather = np.repeat(indptr[:-1][perm].astype(np.int64) - new_indptr[:-1], counts) + np.arange(new_indptr[-1])
+    return new_indptr, rank[indices[gather]], weights[gather]
+
+
+@njit(cache=True, boundscheck=False)
+def _rcm_csr(indptr: np.ndarray,
+             indices: np.ndarray,
+             degrees: np.ndarray,
+             starts: np.ndarray) -> np.ndarray:
+    """Breadth first visit of the Cuthill-McKee ordering, returned reversed.
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    degrees : The degrees of the nodes.
+    starts : The node ids sorted by increasing degree, the roots of the components.
+
+    Returns
+    -------
+    The node ids in the reverse Cuthill-McKee order.
+    """
+    n = len(degrees)
+    order = np.empty(n, dtype=np.int32)
+    visited = np.zeros(n, dtype=np.bool_)
+    max_degree = degrees.max() if n > 0 else 0
+    queued = np.empty(max_degree, dtype=np.int32)
+    queued_degrees = np.empty(max_degree, dtype=np.int32)
+
+    head = 0
+    tail = 0
+    for root in starts:
+        if visited[root]:
+            continue
+        visited[root] = True
+        order[tail] = root
+        tail += 1
+        # `order[head:tail]` is the queue of the breadth first visit.
+        while head < tail:
+            node = order[head]
+            head += 1
+            n_queued = 0
+            for k in range(indptr[node], indptr[node + 1]):
+                nbr = indices[k]
+                if not visited[nbr]:
+                    visited[nbr] = True
+                    queued[n_queued] = nbr
+                    queued_degrees[n_queued] = degrees[nbr]
+                    n_queued += 1
+            for i in np.argsort(queued_degrees[:n_queued], kind="mergesort"):
+                order[tail] = queued[i]
+                tail += 1
+
+    return order[::-1].copy()
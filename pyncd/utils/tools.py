@@ -9,24 +9,59 @@ import networkx as nx
 import numpy as np
 import os
 import random
-import torch
+from functools import lru_cache
 from inspect import isclass
-from typing import Any, Union, List, Tuple, Dict, Set
+from numba import njit
+from pyncd.utils.converter import import_igraph, to_csr
+from typing import Any, Union, Optional, List, Tuple, Dict, Set
 
 
-def set_seed(manual_seed: int) -> None:
+def set_seed(manual_seed: int, deterministic: bool = False) -> None:
     """Set random seeds
+
+    Parameters
+    ----------
+    manual_seed : int
+        The seed of Python, NumPy, Numba and torch random generators.
+    deterministic : bool, optional (default=False)
+        If True, make cuDNN select deterministic algorithms, at the cost of speed.
     """
     random.seed(manual_seed)
     os.environ['PYTHONHASHSEED'] = str(manual_seed)
     np.random.seed(manual_seed)
+    set_numba_seed(manual_seed)
+    torch, cuda_available = _load_torch()
+    if torch is None:
+        return
     torch.manual_seed(manual_seed)
-    if torch.cuda.is_available():
-        torch.cuda.manual_seed(manual_seed)
+    if cuda_available:
         torch.cuda.manual_seed_all(manual_seed)
+    if deterministic:
         torch.backends.cudnn.deterministic = True
         torch.backends.cudnn.benchmark = False
-        torch.backends.cudnn.enabled = False
+
+
+@lru_cache(maxsize=1)
+def _load_torch() -> Tuple[Any, bool]:
+    """Import torch on first use
+
+    Returns
+    -------
+    torch : The torch module, None if torch is not installed.
+    cuda_available : True if CUDA is available.
+    """
+    try:
+        import torch
+    except ImportError:
+        return None, False
+    return torch, torch.cuda.is_available()
+
+
+@njit(cache=True)
+def set_numba_seed(manual_seed: int) -> None:
+    """Set the random seed used by the Numba compiled functions
+    """
+    np.random.seed(manual_seed)
 
 
 def check_is_fitted(
@@ -48,9 +83,10 @@ def check_is_fitted(
     attrs : str, list or tuple of str, default=None
         Attribute name(s) given as string or a list/tuple of strings
 
-        If `None`, `detector` is considered fitted if there exist an
-        attribute that ends with a underscore and does not start with double
-        underscore.
+        If `None`, `detector` is considered fitted if the attributes listed
+        in its `__fitted_attrs__` are set. Without `__fitted_attrs__`, if there
+        exist an attribute that ends with a underscore and does not start with
+        double underscore.
     msg : str, default=None
         The default error message is, "This %(name)s instance is not fitted
         yet. Call 'fit' with appropriate arguments before using this detector."
@@ -81,9 +117,11 @@ def check_is_fitted(
     if attrs is not None:
         if not isinstance(attrs, (list, tuple)):
             attrs = [attrs]
-        fitted = all_or_any([hasattr(detector, attr) and getattr(detector, attr) is not None for attr in attrs])
+        fitted = all_or_any(getattr(detector, attr, None) is not None for attr in attrs)
     elif hasattr(detector, "__detector_is_fitted__"):
         fitted = detector.__detector_is_fitted__()
+    elif getattr(detector, "__fitted_attrs__", None) is not None:
+        fitted = all_or_any(getattr(detector, attr, None) is not None for attr in detector.__fitted_attrs__)
     else:
         fitted = [
             v for v in vars(detector) if v.endswith("_") and not v.startswith("__")
@@ -93,15 +131,182 @@ def check_is_fitted(
         raise RuntimeError(msg % {"name": type(detector).__name__})
 
 
-def color_network(graph: nx.Graph) -> Dict[int, Set[Any]]:
+def group_labels(labels: np.ndarray) -> List[np.ndarray]:
+    """Gather the members of every community of a label array in one sorting pass.
+
+    Parameters
+    ----------
+    labels : An array of the communities index of the nodes, numbered from 0.
+
+    Returns
+    -------
+    A list of arrays, the i-th one holds the ids of the nodes in the i-th community.
+    """
+    if len(labels) == 0:
+        return []
+    order = np.argsort(labels, kind="stable")
+    splits = np.cumsum(np.bincount(labels))[:-1]
+    return np.split(order, splits)
+
+
+def color_network(
+        graph: nx.Graph,
+        strategy: str = "largest_first",
+        backend: Optional[str] = None) -> Dict[int, Set[Any]]:
     """Colors the network so that neighboring nodes all have distinct colors.
     Returns a dict keyed by color to a set of nodes with that color.
+
+    The nodes are colored greedily in the order given by `strategy`, see `color_csr`.
+    With "largest_first", the coloring is the one of `nx.coloring.greedy_color`. For
+    directed graphs, the predecessors and the successors of a node are its neighbors.
+    With the "igraph" `backend`, the coloring of `igraph.Graph.vertex_coloring_greedy`
+    is used instead and `strategy` is ignored.
     """
-    coloring = dict()  # color => set(node)
-    colors = nx.coloring.greedy_color(graph)
-    for node, color in colors.items():
-        if color in coloring:
-            coloring[color].add(node)
-        else:
-            coloring[color] = {node}
-    return coloring
+    indptr, indices, _, nodes = to_csr(graph, None)
+    if backend is None:
+        colors = color_csr(indptr, indices, strategy)
+    elif backend == "igraph":
+        ig = import_igraph()
+        rows = np.repeat(np.arange(len(nodes), dtype=np.int32), np.diff(indptr))
+        mask = rows < indices
+        ig_graph = ig.Graph(n=len(nodes), edges=np.column_stack((rows[mask], indices[mask])).tolist())
+        colors = np.array(ig_graph.vertex_coloring_greedy(), dtype=np.int64)
+    else:
+        raise NotImplementedError(f"`{backend}` is not implemented")
+    return {color: {nodes[i] for i in members.tolist()} for color, members in enumerate(group_labels(colors))}
+
+
+def color_csr(indptr: np.ndarray, indices: np.ndarray, strategy: str = "largest_first") -> np.ndarray:
+    """Colors a CSR adjacency greedily, so that neighboring nodes all have distinct colors.
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    strategy : string, optional (default="largest_first")
+        The order in which the nodes are colored. If "largest_first", by decreasing degree.
+        If "smallest_last", each node is colored after all the nodes left once it has been
+        removed as a node of smallest degree, which uses at most one more color than the
+        degeneracy of the graph. Ties between nodes of the same degree are not broken as
+        in `nx.coloring.greedy_color`, so the number of colors can differ from it.
+
+    Returns
+    -------
+    An int32 array of the colors of the nodes, numbered from 0.
+    """
+    if strategy == "largest_first":
+        order = np.argsort(-np.diff(indptr), kind="stable").astype(np.int32)
+    elif strategy == "smallest_last":
+        order = _smallest_last_csr(indptr, indices)
+    else:
+        raise NotImplementedError(f"`{strategy}` is not implemented")
+    return greedy_color_csr(indptr, indices, order)
+
+
+@njit(cache=True)
+def max_degree(indptr: np.ndarray) -> int:
+    """Returns the maximum number of neighbours of a node in a CSR adjacency.
+    """
+    degree = 0
+    for node in range(len(indptr) - 1):
+        degree = max(degree, indptr[node + 1] - indptr[node])
+    return degree
+
+
+@njit(cache=True, boundscheck=False)
+def greedy_color_csr(indptr: np.ndarray, indices: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Greedy coloring of a CSR adjacency, each node takes the smallest color unused by its neighbors.
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+    order : The node ids in the order in which they are colored.
+
+    Returns
+    -------
+    An int32 array of the colors of the nodes, numbered from 0.
+    """
+    n = len(indptr) - 1
+    colors = np.full(n, -1, dtype=np.int32)
+
+    # `forbidden[color] == node` tells whether a neighbor of `node` already has `color`.
+    forbidden = np.full(max_degree(indptr) + 1, -1, dtype=np.int32)
+    for node in order:
+        for k in range(indptr[node], indptr[node + 1]):
+            color = colors[indices[k]]
+            if color >= 0:
+                forbidden[color] = node
+        color = 0
+        while forbidden[color] == node:
+            color += 1
+        colors[node] = color
+
+    return colors
+
+
+@njit(cache=True, boundscheck=False)
+def _smallest_last_csr(indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Smallest-last ordering of a CSR adjacency, in O(n + m) with a bucket queue keyed by degree.
+
+    Parameters
+    ----------
+    indptr : The row pointers of the CSR adjacency.
+    indices : The node ids of the neighbours in the CSR adjacency.
+
+    Returns
+    -------
+    An int32 array of the node ids in the reverse order of their removal.
+    """
+    n = len(indptr) - 1
+    order = np.empty(n, dtype=np.int32)
+    degrees = np.empty(n, dtype=np.int32)
+    for node in range(n):
+        degrees[node] = indptr[node + 1] - indptr[node]
+    max_degree = degrees.max() if n > 0 else 0
+
+    # The nodes of degree d form a doubly linked list starting at `head[d]`.
+    head = np.full(max_degree + 1, -1, dtype=np.int32)
+    nxt = np.full(n, -1, dtype=np.int32)
+    prv = np.full(n, -1, dtype=np.int32)
+    for node in range(n):
+        nxt[node] = head[degrees[node]]
+        if nxt[node] >= 0:
+            prv[nxt[node]] = node
+        head[degrees[node]] = node
+    removed = np.zeros(n, dtype=np.bool_)
+
+    min_degree = 0
+    for k in range(n):
+        while head[min_degree] < 0:
+            min_degree += 1
+        node = head[min_degree]
+        head[min_degree] = nxt[node]
+        if nxt[node] >= 0:
+            prv[nxt[node]] = -1
+        removed[node] = True
+        order[n - 1 - k] = node
+
+        for i in range(indptr[node], indptr[node + 1]):
+            nbr = indices[i]
+            if removed[nbr]:
+                continue
+            # Move the neighbour to the bucket of its decremented degree.
+            degree = degrees[nbr]
+            if prv[nbr] >= 0:
+                nxt[prv[nbr]] = nxt[nbr]
+            else:
+                head[degree] = nxt[nbr]
+            if nxt[nbr] >= 0:
+                prv[nxt[nbr]] = prv[nbr]
+            degree -= 1
+            degrees[nbr] = degree
+            prv[nbr] = -1
+            nxt[nbr] = head[degree]
+            if nxt[nbr] >= 0:
+                prv[nxt[nbr]] = nbr
+            head[degree] = nbr
+            if degree < min_degree:
+                min_degree = degree
+
+    return order
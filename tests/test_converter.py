@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""A test unit for the conversion functions
+"""
+
+import importlib.util
+import unittest
+import networkx as nx
+from pyncd.utils.converter import convert_multigraph, to_csr
+
+HAS_IGRAPH = importlib.util.find_spec("igraph") is not None
+
+
+class TestConverter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.graph = nx.MultiGraph(nx.karate_club_graph())
+        cls.graph.add_edges_from(list(cls.graph.edges())[:20], weight=2)
+
+    def test_convert_multigraph(self):
+        new_graph = convert_multigraph(self.graph, "weight", 1)
+        assert new_graph.number_of_edges() == nx.Graph(self.graph).number_of_edges()
+        assert new_graph.size(weight="weight") == self.graph.size(weight="weight")
+        assert not new_graph.graph
+
+    def test_convert_multigraph_weight(self):
+        # Both the multigraph and the simple graph paths reject weights that are not numbers.
+        for graph in (nx.MultiGraph([(0, 1), (0, 1)]), nx.Graph([(0, 1)])):
+            for weight, default in ((False, 1), (True, 1), ("weight", None)):
+                with self.assertRaises(ValueError):
+                    convert_multigraph(graph, weight, default)
+            assert convert_multigraph(graph, None)[0][1]["weight"] == graph.number_of_edges(0, 1)
+            assert convert_multigraph(graph, "weight", 3)[0][1]["weight"] == 3 * graph.number_of_edges(0, 1)
+
+    @unittest.skipUnless(HAS_IGRAPH, "requires python-igraph")
+    def test_convert_multigraph_igraph(self):
+        for graph, is_directed in ((self.graph, False), (nx.MultiDiGraph(self.graph), True),
+                                   (nx.MultiDiGraph(self.graph), False)):
+            # The summed weights, computed edge by edge from the multigraph.
+            expected = {}
+            for u, v, wt in graph.edges(data="weight", default=1):
+                key = (u, v) if is_directed else frozenset((u, v))
+                expected[key] = expected.get(key, 0) + wt
+            new_graph = convert_multigraph(graph, "weight", 1, is_directed, backend="igraph")
+            assert new_graph.is_directed() == is_directed
+            assert new_graph.number_of_edges() == len(expected)
+            for u, v, wt in new_graph.edges(data="weight"):
+                assert abs(expected[(u, v) if is_directed else frozenset((u, v))] - wt) < 1e-9
+
+    def test_to_csr(self):
+        new_graph = convert_multigraph(self.graph, "weight", 1)
+        indptr, indices, weights, nodes = to_csr(new_graph)
+        assert len(indices) == 2 * new_graph.number_of_edges()
+        assert weights.sum() == 2 * new_graph.size(weight="weight")
+
+        # The CSR follows the edits of the graph.
+        new_graph.remove_edges_from(list(new_graph.edges()))
+        indptr, indices, weights, nodes = to_csr(new_graph)
+        assert len(indices) == 0 and len(nodes) == len(new_graph)
+
+    def tearDown(self) -> None:
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,20 +4,24 @@
 
 import unittest
 import networkx as nx
-from pyncd.models.label_propagation import LPADetector
+import numpy as np
+from pyncd.models.label_propagation import LPADetector, _best_labels
+from pyncd.utils.converter import to_csr
+from pyncd.utils.tools import max_degree
 
 
 class TestLPA(unittest.TestCase):
-    def setUp(self) -> None:
-        self.async_type = "async"
-        self.alpha = 1.0
-        self.beta = 1.0
-        self.random_state = 123
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.async_type = "async"
+        cls.alpha = 1.0
+        cls.beta = 1.0
+        cls.random_state = 123
 
-        self.graph = nx.tutte_graph()
-        self.nodes = [node for node in self.graph.nodes()]
-        self.detector = LPADetector(self.async_type, self.alpha, self.beta, self.random_state)
-        self.detector.fit(self.graph)
+        cls.graph = nx.tutte_graph()
+        cls.nodes = [node for node in cls.graph.nodes()]
+        cls.detector = LPADetector(cls.async_type, cls.alpha, cls.beta, cls.random_state)
+        cls.detector.fit(cls.graph)
 
     def test_parameters(self):
         assert (hasattr(self.detector, "decision_com_graph_") and
@@ -27,6 +31,19 @@ class TestLPA(unittest.TestCase):
         assert (hasattr(self.detector, "decision_com_node2com_") and
                 self.detector.decision_com_node2com_)
 
+    def test_not_fitted(self):
+        with self.assertRaises(RuntimeError):
+            LPADetector().decision_function(self.nodes)
+
+    def test_random_state(self):
+        # The seed is set at the start of every fit, so refitting gives the same labels.
+        graph = nx.karate_club_graph()
+        detector = LPADetector(self.async_type, self.alpha, self.beta, self.random_state)
+        labels = detector.fit(graph).decision_function(list(graph))
+        np.random.rand(10)
+        assert detector.fit(graph).decision_function(list(graph)) == labels
+        assert LPADetector(self.async_type, self.alpha, self.beta, self.random_state).fit(graph).decision_function(list(graph)) == labels
+
     def test_decision_function(self):
         node_com = self.detector.decision_function(self.nodes)
         assert len(node_com) == len(self.nodes)
@@ -36,13 +53,51 @@ class TestLPA(unittest.TestCase):
         assert len(res) == len(self.graph)
         assert len(set(res.values())) > 0
 
+    def test_sync_lpa(self):
+        res = self.detector.sync_lpa(self.graph)
+        assert len(res) == len(self.graph)
+        assert len(set(res.values())) > 0
+
     def test_semi_async_lpa(self):
         res = self.detector.semi_async_lpa(self.graph)
         assert len(res) == len(self.graph)
         assert len(set(res.values())) > 0
 
-    def test_most_frequent_labels(self):
-        pass
+    def test_reordered_graph(self):
+        # Graphs of at least RCM_MIN_NODES nodes are swept in the reverse Cuthill-McKee order.
+        graph = nx.caveman_graph(300, 5)
+        cliques = {frozenset(clique) for clique in nx.connected_components(graph)}
+        for async_type in ("async", "semi", "sync"):
+            detector = LPADetector(async_type, self.alpha, self.beta, self.random_state).fit(graph)
+            assert {frozenset(com) for _, com in detector.decision_com_graph_.nodes(data="nodes")} == cliques
+
+    def test_best_labels(self):
+        graph = nx.gnp_random_graph(200, 0.05, seed=self.random_state)
+        rng = np.random.RandomState(self.random_state)
+        for u, v in graph.edges():
+            graph[u][v]["weight"] = float(rng.randint(1, 4))
+        indptr, indices, weights, nodes = to_csr(graph)
+        labels = rng.randint(0, 20, size=len(nodes)).astype(np.int32)
+
+        size = max(max_degree(indptr), 1)
+        label_freq = np.zeros(len(nodes), dtype=np.float64)
+        mark = np.full(len(nodes), -1, dtype=np.int32)
+        touched = np.empty(size, dtype=np.int32)
+        best_labels = np.empty(size, dtype=np.int32)
+        for node in range(len(nodes)):
+            # The labels of maximum weighted frequency among the neighbours, counted in Python.
+            freq = {}
+            for nbr, wt in zip(indices[indptr[node]:indptr[node + 1]], weights[indptr[node]:indptr[node + 1]]):
+                freq[labels[nbr]] = freq.get(labels[nbr], 0) + wt
+            expected = {label for label, wt in freq.items() if wt == max(freq.values())}
+
+            n_best, is_best = _best_labels(node, indptr, indices, weights, labels,
+                                           label_freq, mark, touched, best_labels)
+            if not expected:
+                assert n_best == 0 and is_best
+            else:
+                assert set(best_labels[:n_best].tolist()) == expected
+                assert is_best == (labels[node] in expected)
 
     def tearDown(self) -> None:
         pass
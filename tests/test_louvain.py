@@ -4,19 +4,22 @@
 
 import unittest
 import networkx as nx
+import numpy as np
 from pyncd.models.louvain import LouvainDetector
+from pyncd.utils.converter import to_csr
 
 
 class TestLouvain(unittest.TestCase):
-    def setUp(self) -> None:
-        self.resolution = 1
-        self.threshold = 0.0000001
-        self.random_state = 123
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.resolution = 1
+        cls.threshold = 0.0000001
+        cls.random_state = 123
 
-        self.graph = nx.petersen_graph()
-        self.nodes = [node for node in self.graph.nodes()]
-        self.detector = LouvainDetector(self.resolution, self.threshold, self.random_state)
-        self.detector.fit(self.graph)
+        cls.graph = nx.petersen_graph()
+        cls.nodes = [node for node in cls.graph.nodes()]
+        cls.detector = LouvainDetector(cls.resolution, cls.threshold, cls.random_state)
+        cls.detector.fit(cls.graph)
 
     def test_parameters(self):
         assert (hasattr(self.detector, "decision_com_graph_") and
@@ -26,24 +29,56 @@ class TestLouvain(unittest.TestCase):
         assert (hasattr(self.detector, "decision_com_node2com_") and
                 self.detector.decision_com_node2com_)
 
+    def test_not_fitted(self):
+        with self.assertRaises(RuntimeError):
+            LouvainDetector().decision_function(self.nodes)
+
+    def test_random_state(self):
+        # The seed is set at the start of every fit, so refitting gives the same labels.
+        graph = nx.karate_club_graph()
+        detector = LouvainDetector(self.resolution, self.threshold, self.random_state)
+        labels = detector.fit(graph).decision_function(list(graph))
+        np.random.rand(10)
+        assert detector.fit(graph).decision_function(list(graph)) == labels
+        assert LouvainDetector(self.resolution, self.threshold, self.random_state).fit(graph).decision_function(list(graph)) == labels
+
     def test_decision_function(self):
         node_com = self.detector.decision_function(self.nodes)
         assert len(node_com) == len(self.nodes)
 
     def test_gen_partition(self):
-        for graph, inner_partition in self.detector.gen_partition(self.graph):
-            assert len(graph) == len(inner_partition)
+        for partition, inner_partition in self.detector.gen_partition(self.graph):
+            assert len(partition) == len(inner_partition)
+
+    def test_reordered_levels(self):
+        # Graphs of at least RCM_MIN_NODES nodes are swept in the reverse Cuthill-McKee order.
+        graph = nx.connected_caveman_graph(300, 5)
+        detector = LouvainDetector(self.resolution, self.threshold, self.random_state)
+        partition, inner_partition = next(detector.gen_partition(graph))
+        assert sorted(map(sorted, partition)) == sorted(map(sorted, inner_partition))
+
+        graph = nx.caveman_graph(300, 5)
+        detector.fit(graph)
+        cliques = {frozenset(clique) for clique in nx.connected_components(graph)}
+        assert {frozenset(com) for _, com in detector.decision_com_graph_.nodes(data="nodes")} == cliques
+
+    def test_multigraph(self):
+        graph = nx.MultiGraph(self.graph)
+        graph.add_edges_from(self.graph.edges())
+        detector = LouvainDetector(self.resolution, self.threshold, self.random_state).fit(graph)
+        assert len(detector.decision_function(self.nodes)) == len(self.nodes)
 
     def test_one_level(self):
-        partition = [{u} for u in self.graph.nodes()]
+        indptr, indices, weights, nodes = to_csr(self.graph)
+        degrees = np.array([deg for _, deg in self.graph.degree(weight="weight")], dtype=np.float64)
 
-        partition, inner_partition, improvement = self.detector.one_level(
-            self.graph, self.graph.size(weight="weight"), partition,
-            "weight", self.resolution, self.graph.is_directed()
+        node2com, gain = self.detector.one_level(
+            indptr, indices, weights, degrees, degrees, self.graph.size(weight="weight"),
+            self.resolution, self.graph.is_directed()
         )
 
-        assert isinstance(improvement, bool)
-        assert len(partition) == len(inner_partition)
+        assert gain >= 0
+        assert len(node2com) == len(nodes)
 
     def tearDown(self) -> None:
         pass
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""A test unit for the utility functions
+"""
+
+import importlib.util
+import unittest
+import networkx as nx
+from pyncd.utils.tools import color_network, set_seed
+
+HAS_IGRAPH = importlib.util.find_spec("igraph") is not None
+HAS_TORCH = importlib.util.find_spec("torch") is not None
+
+
+class TestTools(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.graphs = [nx.karate_club_graph(), nx.gnm_random_graph(300, 1500, seed=123),
+                      nx.gnp_random_graph(100, 0.1, seed=123, directed=True), nx.Graph()]
+
+    def assert_proper(self, graph, coloring):
+        colors = {node: color for color, nodes in coloring.items() for node in nodes}
+        assert len(colors) == len(graph)
+        assert all(colors[u] != colors[v] for u, v in graph.edges() if u != v)
+
+    def test_color_network(self):
+        for graph in self.graphs:
+            coloring = color_network(graph)
+            self.assert_proper(graph, coloring)
+            if not graph.is_directed():
+                assert len(coloring) == len(set(nx.coloring.greedy_color(graph).values()))
+
+    def test_smallest_last(self):
+        for seed in range(5):
+            graph = nx.gnm_random_graph(300, 1500 + 50 * seed, seed=seed)
+            coloring = color_network(graph, "smallest_last")
+            self.assert_proper(graph, coloring)
+            assert len(coloring) <= max(nx.core_number(graph).values()) + 1
+        for graph in self.graphs:
+            self.assert_proper(graph, color_network(graph, "smallest_last"))
+
+    @unittest.skipUnless(HAS_IGRAPH, "requires python-igraph")
+    def test_color_network_igraph(self):
+        for graph in self.graphs:
+            coloring = color_network(graph, backend="igraph")
+            self.assert_proper(graph, coloring)
+            assert len(coloring) <= max(dict(nx.Graph(graph).degree()).values(), default=-1) + 1
+
+    @unittest.skipUnless(HAS_TORCH, "requires torch")
+    def test_set_seed(self):
+        import torch
+        cudnn = torch.backends.cudnn
+        flags = cudnn.enabled, cudnn.deterministic, cudnn.benchmark
+        try:
+            cudnn.deterministic = False
+            set_seed(123)
+            assert cudnn.enabled and not cudnn.deterministic
+            first = torch.rand(3)
+            set_seed(123, deterministic=True)
+            assert cudnn.enabled and cudnn.deterministic and not cudnn.benchmark
+            assert torch.equal(torch.rand(3), first)
+        finally:
+            cudnn.enabled, cudnn.deterministic, cudnn.benchmark = flags
+
+    def tearDown(self) -> None:
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()